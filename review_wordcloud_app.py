@@ -3,19 +3,35 @@
 리뷰 워드 클라우드 + AI 마케팅 인사이트
 실행: py -3.13 -m streamlit run review_wordcloud_app.py
 """
-import io, re, textwrap, random
-from collections import Counter
+import io, re, codecs, hashlib, logging, textwrap, random, threading
+from itertools import compress
+from concurrent.futures import ThreadPoolExecutor
+from heapq import nlargest
+from operator import itemgetter
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 import pandas as pd
-import matplotlib.pyplot as plt
+import numpy as np
 import matplotlib.font_manager as fm
 from wordcloud import WordCloud
 from kiwipiepy import Kiwi
+from charset_normalizer import from_bytes
+import ahocorasick
 import google.generativeai as genai
+from google.generativeai import client as genai_client
 
-kiwi = Kiwi()
+log = logging.getLogger(__name__)
+logging.getLogger("fontTools.subset").setLevel(logging.ERROR)  # SVG 폰트 임베드 시 "TSI* NOT subset" 경고 억제
 
-STOPWORDS = {
+@st.cache_resource(show_spinner=False)
+def get_kiwi():
+    # 재실행마다 모델을 다시 로드하지 않도록 프로세스당 한 번만 생성
+    # num_workers=-1: 배치 분석에 모든 코어 사용 (0.21+ 기본값, 이전 버전에서도 동일하게 동작하도록 명시)
+    return Kiwi(num_workers=-1)
+
+kiwi = get_kiwi()
+
+STOPWORDS = frozenset({
     "것","수","등","더","위","때","중","곳","걸","뭐","좀","잘",
     "그","이","저","또","및","를","에","의","가","은","는","로",
     "와","과","도","들","나","때문","거","게","데","점","듯",
@@ -24,20 +40,49 @@ STOPWORDS = {
     "자체","사용","구매","구입","주문","배송","제품","상품","후기",
     "계속","부분","정말","진짜","완전","너무","아주","매우","엄청",
     "생각","느낌","기분","처음","마음",
-}
-POSITIVE_WORDS = {"좋다","좋아","좋은","최고","만족","추천","훌륭","완벽","좋았","대박","사랑","예쁘","깔끔","부드럽","촉촉","보습","향기","고급","산뜻","개운","효과","굿","괜찮","편하","맘에"}
-NEGATIVE_WORDS = {"별로","싫","나쁘","아쉽","불만","최악","후회","실망","짜증","자극","따갑","건조","거칠","아프","불편","비싸","냄새","가렵","트러블","뾰루지","알레르기","안좋","못쓰"}
-
-def extract_nouns(text):
-    result = kiwi.analyze(text)
-    return [t.form for t in result[0][0] if t.tag in ("NNG","NNP","SL") and len(t.form)>=2 and t.form not in STOPWORDS]
+})
+POSITIVE_WORDS = frozenset({"좋다","좋아","좋은","최고","만족","추천","훌륭","완벽","좋았","대박","사랑","예쁘","깔끔","부드럽","촉촉","보습","향기","고급","산뜻","개운","효과","굿","괜찮","편하","맘에"})
+NEGATIVE_WORDS = frozenset({"별로","싫","나쁘","아쉽","불만","최악","후회","실망","짜증","자극","따갑","건조","거칠","아프","불편","비싸","냄새","가렵","트러블","뾰루지","알레르기","안좋","못쓰"})
+SENT_CATS = ["positive","negative","neutral"]
+CLEAN_RE = re.compile(r"[^\w\s]")  # \w가 한글·영문을 이미 포함
+
+NOUN_TAGS = frozenset({"NNG","NNP","SL"})
+
+def extract_nouns(texts, min_wl=2, banned=STOPWORDS, weights=None):
+    # 리뷰 리스트를 한 번에 분석 (리뷰별 호출 대신 배치 처리), banned: 불용어 합집합
+    # weights: (텍스트 수, k) 가중치 행렬 → 열마다 {단어: 빈도} dict를 담은 길이 k 리스트 반환
+    W=np.ones((len(texts),1)) if weights is None else np.asarray(weights)
+    if W.ndim==1: W=W[:,None]
+    ml=max(2,min_wl); forms=[]; rows=[]
+    for i,toks in enumerate(kiwi.tokenize(texts)):
+        for t in toks:
+            if t.tag not in NOUN_TAGS: continue  # 조사·어미 등 대부분의 토큰은 form 접근 없이 건너뜀
+            f=t.form
+            if len(f)>=ml and f not in banned: forms.append(f); rows.append(i)
+    if not forms: return [{} for _ in range(W.shape[1])]
+    # 해시 기반 factorize로 단어 코드화 후 bincount 집계 (고정폭 유니코드 배열을 만들지 않음)
+    inv,words=pd.factorize(np.asarray(forms,dtype=object)); rows=np.asarray(rows)
+    res=[]
+    for j in range(W.shape[1]):
+        cnt=np.bincount(inv,weights=W[rows,j],minlength=len(words)).astype(np.int64); nz=cnt>0
+        res.append(dict(zip(words[nz],cnt[nz].tolist())))
+    return res
+
+SENT_AC = ahocorasick.Automaton()
+for w in POSITIVE_WORDS: SENT_AC.add_word(w,("pos",w))
+for w in NEGATIVE_WORDS: SENT_AC.add_word(w,("neg",w))
+SENT_AC.make_automaton()
 
 def classify_sentiment_by_text(text):
-    pos = sum(1 for w in POSITIVE_WORDS if w in text)
-    neg = sum(1 for w in NEGATIVE_WORDS if w in text)
+    # 감성어 전체를 한 번의 스캔으로 매칭 (단어별 포함 여부만 집계)
+    hits={v for _,v in SENT_AC.iter(text)}
+    pos = sum(1 for k,_ in hits if k=="pos")
+    neg = len(hits)-pos
     return "positive" if pos>neg else ("negative" if neg>pos else "neutral")
 
+@st.cache_resource(show_spinner=False)
 def get_korean_font_path():
+    # 재실행마다 폰트 목록을 다시 훑지 않도록 프로세스 단위로 캐시
     for p in ["C:/Windows/Fonts/malgun.ttf","C:/Windows/Fonts/gulim.ttc"]:
         try: fm.FontProperties(fname=p); return p
         except: continue
@@ -50,43 +95,132 @@ REVIEW_COLS = ["리뷰","내용","리뷰내용","리뷰 내용","후기","review
 RATING_COLS = ["별점","평점","점수","rating","score","star","stars"]
 
 def find_col(df, candidates):
-    m = {c.strip().lower(): c for c in df.columns}
+    # 후보 순서 우선, 정확히 일치하면 정규화 dict 생성 없이 바로 반환
+    m = None
     for c in candidates:
+        if c in df.columns: return c
+        if m is None: m = {str(k).strip().lower(): k for k in df.columns}
         if c in m: return m[c]
     return None
 
+@st.cache_data(show_spinner=False, max_entries=24, ttl=3600)
 def make_wc(freq, cmap="Set2"):
-    if not freq:
-        fig,ax=plt.subplots(figsize=(12,5)); ax.text(.5,.5,"데이터 없음",ha="center",va="center",fontsize=24,color="#666",transform=ax.transAxes); ax.set_facecolor("#0e1117"); fig.patch.set_facecolor("#0e1117"); ax.axis("off"); return fig
+    # freq: (단어,빈도) 튜플 → 같은 입력이면 레이아웃 재계산 생략. 반환: (PNG bytes, WordCloud), 데이터 없으면 None
+    freq=dict(freq)
+    if not freq: return None
     wc=WordCloud(font_path=KOREAN_FONT or None,width=1200,height=600,background_color="#0e1117",colormap=cmap,max_words=80,prefer_horizontal=.7,min_font_size=14,max_font_size=120).generate_from_frequencies(freq)
-    fig,ax=plt.subplots(figsize=(12,5)); ax.imshow(wc,interpolation="bilinear"); ax.axis("off"); fig.patch.set_facecolor("#0e1117"); plt.tight_layout(pad=0); return fig
-
-def fig_bytes(fig):
-    buf=io.BytesIO(); fig.savefig(buf,format="png",dpi=150,bbox_inches="tight",facecolor="#0e1117",edgecolor="none"); buf.seek(0); return buf.getvalue()
+    # matplotlib 렌더링 없이 PIL 이미지를 바로 PNG로
+    buf=io.BytesIO(); wc.to_image().save(buf,format="PNG"); return buf.getvalue(),wc
+
+@st.cache_data(show_spinner=False, max_entries=12, ttl=3600)
+def wc_svg(freq, cmap="Set2"):
+    # SVG 다운로드 전용: 캐시된 레이아웃을 재사용하고 폰트 서브셋을 임베드
+    wc=make_wc(freq,cmap)[1]
+    try: return wc.to_svg(embed_font=True)
+    except Exception as e:
+        log.warning("SVG 폰트 임베드 실패 (%s) → 폰트 이름만 참조, 보는 환경의 폰트에 따라 표시가 달라질 수 있음",e)
+        return wc.to_svg()
+
+def render_wcs(specs):
+    # 워드 클라우드 3개를 병렬 생성 (st.image 호출은 메인 스레드에서)
+    ctx=get_script_run_ctx()
+    with ThreadPoolExecutor(max_workers=len(specs),initializer=lambda: add_script_run_ctx(threading.current_thread(),ctx)) as ex:
+        return list(ex.map(lambda a: make_wc(*a),specs))
+
+def show_wc(res, spec, label, fname, key, svg=False):
+    if res is None: st.info(f"{label} 데이터 없음"); return
+    st.image(res[0],use_container_width=True)
+    if svg: st.download_button(f"📥 {label} SVG",wc_svg(*spec).encode("utf-8"),f"{fname}.svg","image/svg+xml",use_container_width=True,key=key)
+    else: st.download_button(f"📥 {label} PNG",res[0],f"{fname}.png","image/png",use_container_width=True,key=key)
+
+def top_items(freq, n):
+    # {단어: 빈도} dict에서 상위 n개 (단어,빈도)
+    return nlargest(n,freq.items(),key=itemgetter(1))
 
 def show_kw_table(freq, top_n, label):
-    items=freq.most_common(top_n)
+    items=top_items(freq,top_n)
     if not items: st.info(f"{label} 키워드 없음"); return
     tdf=pd.DataFrame(items,columns=["키워드","빈도"]); tdf.index=range(1,len(tdf)+1); tdf.index.name="순위"
     st.dataframe(tdf,use_container_width=True,height=min(38*len(tdf)+38,600))
     st.download_button(f"📥 {label} CSV",tdf.to_csv(encoding="utf-8-sig"),f"{label}_keywords.csv","text/csv",use_container_width=True,key=f"dl_{label}")
 
-def build_prompt(pos_kw, neg_kw, neg_samples, total, pos_n, neg_n):
-    pk=", ".join(f"{w}({c})" for w,c in pos_kw[:15])
-    nk=", ".join(f"{w}({c})" for w,c in neg_kw[:15])
-    ns="\n".join(f"- {r[:200]}" for r in neg_samples[:15])
-    return textwrap.dedent(f"""\
-    당신은 전천후 데이터 사이언티스트이자 마케팅 전략가입니다.
+def csv_encodings(raw, first=None):
+    # 인코딩 후보: (헤더에서 확인된 인코딩) → utf-8(BOM 있으면 utf-8-sig) → cp949 → euc-kr → 앞 64KB 추정값
+    # 별도 검증 디코딩 없이 파서의 엄격 디코딩(UnicodeDecodeError)으로 다음 후보 여부를 판단
+    seen=set()
+    for enc in [first,"utf-8-sig" if raw.startswith(codecs.BOM_UTF8) else "utf-8","cp949","euc-kr"]:
+        if enc and enc not in seen: seen.add(enc); yield enc
+    best=from_bytes(raw[:65536]).best()  # 위 후보가 모두 실패할 때만 추정
+    if best and best.encoding not in seen:
+        try: codecs.lookup(best.encoding); yield best.encoding
+        except LookupError: pass
+
+def has_binary_col(df):
+    # pyarrow는 UTF-8이 아닌 문자열 컬럼을 오류 없이 bytes로 읽음 → 디코딩 실패로 간주
+    for c in df.columns:
+        i=df[c].first_valid_index()
+        if i is not None and isinstance(df[c].loc[i],bytes): return True
+    return False
+
+def read_csv_as(raw, enc, usecols=None, nrows=None):
+    if nrows is None and enc in ("utf-8","utf-8-sig"):
+        # pyarrow는 codec 이름이 정확히 utf-8일 때만 파이썬 변환을 건너뜀 (BOM은 스스로 제거)
+        try: df=pd.read_csv(io.BytesIO(raw),engine="pyarrow",encoding="utf-8",usecols=usecols)
+        except (ImportError,pd.errors.ParserError): df=None  # pyarrow 미설치·따옴표 안 줄바꿈 등 pyarrow가 못 읽는 형식 → 기본 엔진
+        if df is not None:
+            if has_binary_col(df): raise UnicodeDecodeError(enc,b"",0,1,"invalid UTF-8 in string column")
+            return df
+    return pd.read_csv(io.BytesIO(raw),encoding=enc,usecols=usecols,nrows=nrows)
+
+# 업로드 파일(최대 50MB)별 결과가 서버 메모리에 쌓이지 않도록 개수·수명 제한 (헤더+데이터 = 업로드당 2개)
+@st.cache_data(show_spinner=False, max_entries=4, ttl=3600)
+def load_df(raw, name, usecols=None, nrows=None, enc=None):
+    # usecols: 필요한 컬럼만 로드, nrows=0: 헤더만 로드, enc: 헤더 읽기에서 확인된 인코딩(첫 후보)
+    # raw 전체를 문자열로 디코딩하지 않고 BytesIO(복사 없음)로 넘겨 파서가 스트리밍 디코딩, 사용한 인코딩은 attrs에 기록
+    if name.endswith(".xlsx"):
+        try: return pd.read_excel(io.BytesIO(raw),engine="calamine",usecols=usecols,nrows=nrows)
+        except (ImportError,ValueError): return pd.read_excel(io.BytesIO(raw),engine="openpyxl",usecols=usecols,nrows=nrows)
+    for e in csv_encodings(raw,enc):
+        try: df=read_csv_as(raw,e,usecols,nrows)
+        except UnicodeDecodeError: continue
+        df.attrs["encoding"]=e; return df
+    return pd.read_csv(io.BytesIO(raw),encoding="utf-8",encoding_errors="replace",usecols=usecols,nrows=nrows)  # 모두 실패 시 기존처럼 대체 문자
+
+def reservoir_sample(it, k):
+    # Algorithm R: 한 번 순회하며 균등 확률로 k개 유지
+    res=[]
+    for i,x in enumerate(it):
+        if i<k: res.append(x)
+        else:
+            j=random.randint(0,i)
+            if j<k: res[j]=x
+    return res
+
+@st.cache_data(show_spinner=False, max_entries=8, ttl=3600)
+def tokenize_all(raw, name, enc, rc, rtc, pmin, nmax, min_wl, esw):
+    # 파일 바이트 + 분석 설정 기준 캐시 → max_words/top_n 등만 바뀌면 재분석 생략
+    df=load_df(raw,name,list(dict.fromkeys(c for c in (rc,rtc) if c)),enc=enc)
+    # 원본 리뷰 컬럼은 복사하지 않고 text만 유지, 별점은 float32로 다운캐스트
+    rdf=pd.DataFrame({"text":df[rc].fillna("").astype(str)})
+    if rtc:
+        rdf["rating"]=pd.to_numeric(df[rtc],errors="coerce",downcast="float"); r=rdf["rating"].to_numpy()
+        rdf["sent"]=pd.Categorical(np.select([r>=pmin,r<=nmax],["positive","negative"],default="neutral"),categories=SENT_CATS)
+    else: rdf["sent"]=pd.Categorical(rdf["text"].map(classify_sentiment_by_text),categories=SENT_CATS)
 
-    ## 분석 데이터
-    - 전체 리뷰: {total:,}개 / 긍정: {pos_n:,}개 / 부정: {neg_n:,}개
-    - 긍정 키워드 TOP15: {pk}
-    - 부정 키워드 TOP15: {nk}
+    neg_sn=reservoir_sample(compress(rdf["text"],(rdf["sent"]=="negative").to_numpy()),15)  # 부정 리뷰 리스트를 만들지 않고 샘플링
 
-    ## 부정 리뷰 샘플
-    {ns}
+    # 리뷰를 한 번만 분석: 동일 텍스트를 묶어 감성별 건수를 가중치로 사용 (긍정/부정/전체)
+    # sort=False: 원래 리뷰 순서 유지 → 동률 키워드는 Counter처럼 먼저 나온 단어가 앞
+    g=rdf.groupby(["text","sent"],observed=True,sort=False).size().unstack("sent",fill_value=0,sort=False).reindex(columns=SENT_CATS,fill_value=0)
+    cl=g.index.to_series().str.replace(CLEAN_RE," ",regex=True).tolist()
+    pf,nf,af=extract_nouns(cl,min_wl,STOPWORDS|esw,np.column_stack([g["positive"],g["negative"],g.sum(axis=1)]))
+    return pf,nf,af,neg_sn,(len(rdf),int(g["positive"].sum()),int(g["negative"].sum()))
 
-    위 데이터 기반으로 아래 4단계 마케팅 보고서를 한국어 마크다운으로 작성하세요.
+# 고정 지시문을 앞에, 데이터 블록을 뒤에 두어 Gemini 암묵적 캐싱의 공통 prefix를 최대화
+PROMPT_HEAD = textwrap.dedent("""\
+    당신은 전천후 데이터 사이언티스트이자 마케팅 전략가입니다.
+
+    아래 분석 데이터와 부정 리뷰 샘플을 기반으로 4단계 마케팅 보고서를 한국어 마크다운으로 작성하세요.
 
     # Step 1: 데이터 탐색 및 카테고리 정의
     1. 제품/서비스 카테고리 정의
@@ -99,12 +233,44 @@ def build_prompt(pos_kw, neg_kw, neg_samples, total, pos_n, neg_n):
 
     # Step 3: 취약 지점 심층 분석 (Voice of Customer)
     1. 문제 키워드 2~3개 선정
-    2. 위 리뷰 원문 인용하며 구체적 불만 분석
+    2. 아래 부정 리뷰 샘플의 원문을 인용하며 구체적 불만 분석
     3. 마케터가 놓치기 쉬운 디테일한 불만 포인트 요약
 
     # Step 4: 실행 가능한 액션 플랜
     - 즉시 실행 가능한 광고 소재 아이디어 3가지 (이미지/영상 컨셉 + 광고 카피)
+
     """)
+PROMPT_DATA = textwrap.dedent("""\
+    ## 분석 데이터
+    - 전체 리뷰: {total:,}개 / 긍정: {pos_n:,}개 / 부정: {neg_n:,}개
+    - 긍정 키워드 TOP15: {pk}
+    - 부정 키워드 TOP15: {nk}
+
+    ## 부정 리뷰 샘플
+    {ns}
+    """)
+
+def build_prompt(pos_kw, neg_kw, neg_samples, total, pos_n, neg_n):
+    pk=", ".join(f"{w}({c})" for w,c in pos_kw[:15])
+    nk=", ".join(f"{w}({c})" for w,c in neg_kw[:15])
+    ns="\n".join(f"- {r[:200]}" for r in neg_samples[:15])
+    return PROMPT_HEAD+PROMPT_DATA.format(total=total,pos_n=pos_n,neg_n=neg_n,pk=pk,nk=nk,ns=ns)
+
+@st.cache_resource(show_spinner=False)
+def genai_lock():
+    # 스크립트는 재실행마다 다시 실행되므로 잠금은 cache_resource로 프로세스 전체에서 공유
+    return threading.Lock()
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def generate_report(key_hash, _api_key, prompt):
+    # 동일 키·프롬프트는 API를 다시 호출하지 않음 (오류는 캐시되지 않음, _api_key는 캐시 키에서 제외)
+    # genai.configure는 프로세스 전역 설정 → configure와 클라이언트 바인딩만 잠금 안에서 수행,
+    # 네트워크 호출(generate_content)은 잠금 밖에서 실행해 다른 세션을 막지 않음
+    with genai_lock():
+        genai.configure(api_key=_api_key)
+        model=genai.GenerativeModel("gemini-2.0-flash")
+        model._client=genai_client.get_default_generative_client()  # 이 키의 클라이언트를 모델에 고정 (이후 configure와 무관)
+    return model.generate_content(prompt).text
 
 # ============================================================
 st.set_page_config(page_title="리뷰 워드 클라우드 + AI 인사이트", page_icon="☁️", layout="wide")
@@ -128,6 +294,7 @@ with st.sidebar:
     max_words = st.slider("최대 단어 수",30,200,80,step=10)
     min_wl = st.slider("최소 글자 수",1,5,2)
     top_n = st.slider("상위 키워드 수",10,50,20,step=5)
+    svg_dl = st.checkbox("SVG로 다운로드 (기본: PNG)",False)
     st.markdown("---")
     st.markdown("### 🚫 추가 불용어")
     csw = st.text_area("제외 단어 (쉼표 구분)", placeholder="배송, 주문")
@@ -135,21 +302,18 @@ with st.sidebar:
 uploaded = st.file_uploader("리뷰 파일 업로드 (.xlsx, .csv)", type=["xlsx","csv"])
 
 if uploaded:
-    try:
-        if uploaded.name.endswith(".xlsx"): df=pd.read_excel(uploaded,engine="openpyxl")
-        else:
-            raw=uploaded.read()
-            for enc in ["utf-8-sig","utf-8","cp949","euc-kr"]:
-                try: td=raw.decode(enc); break
-                except: continue
-            else: td=raw.decode("utf-8",errors="replace")
-            df=pd.read_csv(io.StringIO(td))
+    raw=uploaded.getvalue()
+    msg=st.empty()
+    try: hdr=load_df(raw,uploaded.name,nrows=0)  # 헤더만 읽어 컬럼 결정
     except Exception as e: st.error(f"파일 오류: {e}"); st.stop()
 
-    st.success(f"✅ **{uploaded.name}** — {len(df):,}행")
-    rc=find_col(df,REVIEW_COLS); rtc=find_col(df,RATING_COLS)
-    if not rc: rc=st.selectbox("리뷰 컬럼 선택:",df.columns.tolist())
+    rc=find_col(hdr,REVIEW_COLS); rtc=find_col(hdr,RATING_COLS)
+    if not rc: rc=st.selectbox("리뷰 컬럼 선택:",hdr.columns.tolist())
     else: st.info(f"📌 리뷰: **{rc}**"+(f" | 별점: **{rtc}**" if rtc else ""))
+    enc=hdr.attrs.get("encoding")  # 헤더에서 확인된 인코딩을 데이터 읽기의 첫 후보로
+    try: df=load_df(raw,uploaded.name,list(dict.fromkeys(c for c in (rc,rtc) if c)),enc=enc)
+    except Exception as e: st.error(f"파일 오류: {e}"); st.stop()
+    msg.success(f"✅ **{uploaded.name}** — {len(df):,}행")
 
     if rtc:
         with st.sidebar:
@@ -159,53 +323,32 @@ if uploaded:
     esw={w.strip() for w in csw.split(",") if w.strip()} if csw else set()
 
     if st.button("🚀 워드 클라우드 + 인사이트 생성",type="primary",use_container_width=True):
-        rdf=df[[rc]].copy(); rdf["text"]=rdf[rc].fillna("").astype(str)
-        if rtc:
-            df[rtc]=pd.to_numeric(df[rtc],errors="coerce"); rdf["rating"]=df[rtc]
-            rdf["sent"]=rdf["rating"].apply(lambda r: "positive" if r>=pmin else ("negative" if r<=nmax else "neutral"))
-        else: rdf["sent"]=rdf["text"].apply(classify_sentiment_by_text)
-
-        pos_rv=rdf[rdf["sent"]=="positive"]["text"].tolist()
-        neg_rv=rdf[rdf["sent"]=="negative"]["text"].tolist()
-        all_rv=rdf["text"].tolist()
-
-        def extr(rvs):
-            ns=[]
-            for r in rvs:
-                c=re.sub(r"[^\w\s가-힣a-zA-Z]"," ",r)
-                ns.extend(n for n in extract_nouns(c) if len(n)>=min_wl and n not in esw)
-            return Counter(ns)
-
-        prog=st.progress(0,"분석 중...")
-        prog.progress(10,"긍정 분석..."); pf=extr(pos_rv)
-        prog.progress(50,"부정 분석..."); nf=extr(neg_rv)
-        prog.progress(90,"전체 분석..."); af=extr(all_rv)
-        prog.empty()
+        with st.spinner("분석 중..."):
+            pf,nf,af,sn,(total,pos_n,neg_n)=tokenize_all(raw,uploaded.name,enc,rc,rtc,pmin if rtc else None,nmax if rtc else None,min_wl,frozenset(esw))
 
         c1,c2,c3=st.columns(3)
-        c1.markdown(f'<div class="sc a"><div class="sn">{len(all_rv):,}</div><div class="sl">전체</div></div>',unsafe_allow_html=True)
-        c2.markdown(f'<div class="sc p"><div class="sn">{len(pos_rv):,}</div><div class="sl">긍정</div></div>',unsafe_allow_html=True)
-        c3.markdown(f'<div class="sc n"><div class="sn">{len(neg_rv):,}</div><div class="sl">부정</div></div>',unsafe_allow_html=True)
+        c1.markdown(f'<div class="sc a"><div class="sn">{total:,}</div><div class="sl">전체</div></div>',unsafe_allow_html=True)
+        c2.markdown(f'<div class="sc p"><div class="sn">{pos_n:,}</div><div class="sl">긍정</div></div>',unsafe_allow_html=True)
+        c3.markdown(f'<div class="sc n"><div class="sn">{neg_n:,}</div><div class="sl">부정</div></div>',unsafe_allow_html=True)
         st.markdown("---")
 
         tw,ti=st.tabs(["☁️ 워드 클라우드","🧠 AI 마케팅 인사이트"])
 
         with tw:
+            specs=[(tuple(top_items(pf,max_words)),"winter"),(tuple(top_items(nf,max_words)),"autumn"),(tuple(top_items(af,max_words)),"Set2")]
+            wp,wn,wa=render_wcs(specs)
             st.markdown("## 😊 긍정 워드 클라우드")
-            fp=make_wc(dict(pf.most_common(max_words)),"winter"); st.pyplot(fp,use_container_width=True)
-            st.download_button("📥 긍정 PNG",fig_bytes(fp),"pos_wc.png","image/png",use_container_width=True,key="dp"); plt.close(fp)
+            show_wc(wp,specs[0],"긍정","pos_wc","dp",svg_dl)
             with st.expander("📊 긍정 키워드",expanded=False): show_kw_table(pf,top_n,"긍정")
             st.markdown("---")
 
             st.markdown("## 😠 부정 워드 클라우드")
-            fn=make_wc(dict(nf.most_common(max_words)),"autumn"); st.pyplot(fn,use_container_width=True)
-            st.download_button("📥 부정 PNG",fig_bytes(fn),"neg_wc.png","image/png",use_container_width=True,key="dn"); plt.close(fn)
+            show_wc(wn,specs[1],"부정","neg_wc","dn",svg_dl)
             with st.expander("📊 부정 키워드",expanded=False): show_kw_table(nf,top_n,"부정")
             st.markdown("---")
 
             st.markdown("## 🌐 전체 워드 클라우드")
-            fa=make_wc(dict(af.most_common(max_words)),"Set2"); st.pyplot(fa,use_container_width=True)
-            st.download_button("📥 전체 PNG",fig_bytes(fa),"all_wc.png","image/png",use_container_width=True,key="da"); plt.close(fa)
+            show_wc(wa,specs[2],"전체","all_wc","da",svg_dl)
             with st.expander("📊 전체 키워드",expanded=False): show_kw_table(af,top_n,"전체")
 
         with ti:
@@ -214,15 +357,12 @@ if uploaded:
                 st.markdown("> 🔑 [Google AI Studio](https://aistudio.google.com/apikey)에서 무료 발급 가능")
             else:
                 st.markdown("## 🧠 AI 마케팅 인사이트 보고서")
-                sn=neg_rv[:15] if len(neg_rv)<=15 else random.sample(neg_rv,15)
-                prompt=build_prompt(pf.most_common(15),nf.most_common(15),sn,len(all_rv),len(pos_rv),len(neg_rv))
+                prompt=build_prompt(top_items(pf,15),top_items(nf,15),sn,total,pos_n,neg_n)
                 with st.spinner("🤖 Gemini AI 분석 중..."):
                     try:
-                        genai.configure(api_key=api_key)
-                        model=genai.GenerativeModel("gemini-2.0-flash")
-                        resp=model.generate_content(prompt)
-                        st.markdown(resp.text)
-                        st.download_button("📥 보고서 다운로드 (.md)",resp.text.encode("utf-8"),"marketing_insight.md","text/markdown",use_container_width=True,key="dl_rpt")
+                        rpt=generate_report(hashlib.sha256(api_key.encode()).hexdigest(),api_key,prompt)
+                        st.markdown(rpt)
+                        st.download_button("📥 보고서 다운로드 (.md)",rpt.encode("utf-8"),"marketing_insight.md","text/markdown",use_container_width=True,key="dl_rpt")
                     except Exception as e:
                         st.error(f"❌ 오류: {e}")
                         st.info("API Key를 확인해주세요.")